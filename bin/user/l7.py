@@ -85,8 +85,16 @@ Output from console that is bound to a sensor cluster:
 
 from __future__ import with_statement
 import socket
+import threading
 import time
 
+try:
+    # python3
+    import queue
+except ImportError:
+    # python2
+    import Queue as queue
+
 try:
     # python3
     from urllib.request import urlopen
@@ -96,17 +104,40 @@ except ImportError:
     from urllib2 import urlopen, URLError, HTTPError
 
 try:
-    import cjson as json
-    setattr(json, 'dumps', json.encode)
-    setattr(json, 'loads', json.decode)
-except (ImportError, AttributeError):
+    # requests keeps the connection to the console open between polls
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    # orjson is fastest, and it decodes bytes directly
+    from orjson import loads as json_loads
+except ImportError:
     try:
-        import simplejson as json
+        import ujson as json
     except ImportError:
-        import json
+        try:
+            import cjson as json
+        except ImportError:
+            try:
+                import simplejson as json
+            except ImportError:
+                import json
+    # cjson calls it decode instead of loads
+    json_loads = getattr(json, 'loads', None) or json.decode
 
 import weewx.drivers
 
+_US = weewx.US
+_TIME = time.time
+
+try:
+    # python3
+    from sys import intern
+except ImportError:
+    # python2 has intern as a builtin
+    pass
+
 try:
     # logging for weewx v4+
     import weeutil.logger
@@ -131,7 +162,7 @@ except ImportError:
         logmsg(syslog.LOG_ERR, msg)
 
 DRIVER_NAME = 'L7'
-DRIVER_VERSION = '0.2'
+DRIVER_VERSION = '0.3'
 
 def loader(config_dict, _):
     return L7Driver(**config_dict[DRIVER_NAME])
@@ -142,10 +173,7 @@ def confeditor_loader():
 
 DEFAULT_ADDR = '192.168.5.1'
 
-class L7ConfigurationEditor(weewx.drivers.AbstractConfEditor):
-    @property
-    def default_stanza(self):
-        return """
+_DEFAULT_STANZA = """
 [L7]
     # This section is for the Raddy L7 LoRa weather station
     driver = user.l7
@@ -153,6 +181,11 @@ class L7ConfigurationEditor(weewx.drivers.AbstractConfEditor):
     addr = %s
 """ % DEFAULT_ADDR
 
+class L7ConfigurationEditor(weewx.drivers.AbstractConfEditor):
+    @property
+    def default_stanza(self):
+        return _DEFAULT_STANZA
+
     def prompt_for_settings(self):
         settings = dict()
         print("Specify the IP address of the weather station console")
@@ -160,19 +193,111 @@ class L7ConfigurationEditor(weewx.drivers.AbstractConfEditor):
         return settings
 
 
+# map each sensor label to a (packet field, converter) for each sensor title
+_INDOOR = {
+    'Temperature': ('inTemp', float),
+    'Humidity': ('inHumidity', int),
+}
+_OUTDOOR = {
+    'Temperature': ('outTemp', float),
+    'Humidity': ('outHumidity', int),
+}
+_PRESSURE = {
+    'Absolute': ('pressure', float),
+}
+_WIND = {
+    'Wind': ('windSpeed', float),
+    'Gust': ('windGuest', float),
+    'Direction Average 2 Minute': ('windDir', float),
+}
+_RAIN = {
+    'Rate': ('rain_rate', float),
+    'Hour': ('rain_hour', float),
+    'Day': ('rain_day', float),
+    'Week': ('rain_week', float),
+    'Month': ('rain_month', float),
+    'Year': ('rain_year', float),
+    'Total': ('rain_total', float),
+}
+_SOLAR = {
+    'Light': ('luminosity', float),
+    'UVI': ('UV', float),
+}
+_TITLE_DISPATCH = {
+    'Indoor': _INDOOR,
+    'Outdoor': _OUTDOOR,
+    'Pressure': _PRESSURE,
+    'Wind Speed': _WIND,
+    'Rainfall': _RAIN,
+    'Solar': _SOLAR,
+}
+# battery status when every sensor battery is ok
+_BATT_OK = intern('All battery are ok')
+# flatten the tables into a single (title, label) -> (field, converter) map
+_FLAT = dict(((title, label), entry)
+             for title, table in _TITLE_DISPATCH.items()
+             for label, entry in table.items())
+
+
+def _data_to_packet(data, last_rain_total, ts=None,
+                    _flat=_FLAT, _time=_TIME, _us=_US, _batt_ok=_BATT_OK):
+    # map the json data into weewx packet format.  the station has a fixed
+    # number of sensors, so this mapping is hard-coded.  however, not every
+    # sensor will report in each query, so be ready for that.
+    #
+    # each sensor has a title and list.  each item in the list is a tuple
+    # of label, value, units, and possibly a fourth value (see Rainfall).
+    # see the example json output at the beginning of this file.  the
+    # title and label together select the packet field.
+    #
+    # FIXME: check units and do conversions if necessary (does the console
+    # setting affect the units reported in the JSON?)
+    #
+    # ts is the time at which the data were received.  if it is not
+    # specified, use the current time.
+    #
+    # the other keyword defaults bind module globals as locals for faster
+    # lookup.  callers should pass only data, last_rain_total, and ts.
+    if ts is None:
+        ts = int(_time() + 0.5)
+    packet = {'dateTime': ts, 'usUnits': _us}
+    if not data:
+        return packet
+    for sensor in data.get('sensor', []):
+        title = sensor.get('title')
+        for item in sensor.get('list', []):
+            entry = _flat.get((title, item[0]))
+            if entry:
+                key, conv = entry
+                packet[key] = conv(item[1])
+    rain_total = packet.get('rain_total')
+    if rain_total is not None and last_rain_total is not None:
+        packet['rain'] = rain_total - last_rain_total
+    battery = data.get('battery', {})
+    batteries = battery.get('list', [])
+    if batteries:
+        # identity is the fast path, equality handles strings from decoders
+        # that do not intern
+        if batteries[0] is _batt_ok or batteries[0] == _batt_ok:
+            packet['battery'] = 0
+    return packet
+
+
 class L7Driver(weewx.drivers.AbstractDevice):
 
     def __init__(self, **stn_dict):
         loginf('driver version is %s' % DRIVER_VERSION)
         addr = stn_dict.get('addr', DEFAULT_ADDR)
         loginf('station address: %s' % addr)
-        self._poll_interval = stn_dict.get('poll_interval', 10) # seconds
+        self._poll_interval = int(stn_dict.get('poll_interval', 10)) # seconds
         loginf('polling interval: %s' % self._poll_interval)
         self._last_rain_total = None
-        self.collector = L7Collector(addr)
+        self.collector = L7Collector(addr, self._poll_interval)
+        self.collector.startup()
 
     def closePort(self):
-        pass
+        self.collector.shutdown()
+        self.collector.close()
 
     @property
     def hardware_name(self):
@@ -180,120 +305,154 @@ class L7Driver(weewx.drivers.AbstractDevice):
 
     def genLoopPackets(self):
         while True:
-            data = self.collector.get_data()
+            try:
+                ts, data = self.collector.queue.get(True, self._poll_interval)
+            except queue.Empty:
+                if not self.collector.is_alive():
+                    raise weewx.WeeWxIOError("collector thread died: %s" %
+                                             self.collector.error)
+                logdbg('no data from collector')
+                continue
             logdbg('data: %s' % data)
-            pkt = self.data_to_packet(data, self._last_rain_total)
+            # use the time at which the data were received, not the time
+            # at which they were taken from the queue
+            pkt = self.data_to_packet(data, self._last_rain_total, ts)
             rain_total = pkt.get('rain_total')
             if rain_total is not None:
                 self._last_rain_total = rain_total
             logdbg('packet: %s' % pkt)
             if pkt:
                 yield pkt
-            time.sleep(self._poll_interval)
-
-    @staticmethod
-    def data_to_packet(data, last_rain_total):
-        # map the json data into weewx packet format.  the station has a fixed
-        # number of sensors, so this mapping is hard-coded.  however, not every
-        # sensor will report in each query, so be ready for that.
-        #
-        # each sensor has a title and list.  each item in the list is a tuple
-        # of label, value, units, and possibly a fourth value (see Rainfall).
-        # see the example json output at the beginning of this file.
-        #
-        # FIXME: check units and do conversions if necessary (does the console
-        # setting affect the units reported in the JSON?)
-        packet = dict()
-        packet['dateTime'] = int(time.time() + 0.5)
-        packet['usUnits'] = weewx.US
-        if not data:
-            return packet
-        sensor_list = data.get('sensor', [])
-        for sensor in sensor_list:
-            title = sensor.get('title')
-            if title == 'Indoor':
-                items = sensor.get('list')
-                for item in items:
-                    if item[0] == 'Temperature':
-                        packet['inTemp'] = float(item[1])
-                    elif item[0] == 'Humidity':
-                        packet['inHumidity'] = int(item[1])
-            elif title == 'Outdoor':
-                items = sensor.get('list')
-                for item in items:
-                    if item[0] == 'Temperature':
-                        packet['outTemp'] = float(item[1])
-                    elif item[0] == 'Humidity':
-                        packet['outHumidity'] = int(item[1])
-            elif title == 'Pressure':
-                items = sensor.get('list')
-                for item in items:
-                    if item[0] == 'Absolute':
-                        packet['pressure'] = float(item[1])
-            elif title == 'Wind Speed':
-                items = sensor.get('list')
-                for item in items:
-                    if item[0] == 'Wind':
-                        packet['windSpeed'] = float(item[1])
-                    elif item[0] == 'Gust':
-                        packet['windGuest'] = float(item[1])
-                    elif item[0] == 'Direction Average 2 Minute':
-                        packet['windDir'] = float(item[1])
-            elif title == 'Rainfall':
-                rain_total = None
-                items = sensor.get('list')
-                for item in items:
-                    if item[0] == 'Rate':
-                        packet['rain_rate'] = float(item[1])
-                    elif item[0] == 'Hour':
-                        packet['rain_hour'] = float(item[1])
-                    elif item[0] == 'Day':
-                        packet['rain_day'] = float(item[1])
-                    elif item[0] == 'Week':
-                        packet['rain_week'] = float(item[1])
-                    elif item[0] == 'Month':
-                        packet['rain_month'] = float(item[1])
-                    elif item[0] == 'Year':
-                        packet['rain_year'] = float(item[1])
-                    elif item[0] == 'Total':
-                        rain_total = float(item[1])
-                        packet['rain_total'] = rain_total
-                if rain_total is not None and last_rain_total is not None:
-                    packet['rain'] = rain_total - last_rain_total
-            elif title == 'Solar':
-                for item in items:
-                    if item[0] == 'Light':
-                        packet['luminosity'] = float(item[1])
-                    elif item[0] == 'UVI':
-                        packet['UV'] = float(item[1])
-        battery = data.get('battery', {})
-        batteries = battery.get('list', [])
-        if batteries:
-            if batteries[0] == 'All battery are ok':
-                packet['battery'] = 0
-        return packet
+
+    data_to_packet = staticmethod(_data_to_packet)
 
 
 class L7Collector(object):
-    def __init__(self, addr=DEFAULT_ADDR):
+    # poll the station in a separate thread and put the data into a queue.
+    # if nobody takes data from the queue, the oldest data are discarded.
+    MAX_QUEUE_SIZE = 10
+    # the response is normally about 1.5KB, so anything much bigger than that
+    # means the console is misbehaving.
+    MAX_RESPONSE_SIZE = 65536
+
+    def __init__(self, addr=DEFAULT_ADDR, poll_interval=10):
         self._addr = addr
+        self._poll_interval = poll_interval
+        self.queue = queue.Queue(maxsize=self.MAX_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+        self.error = None # the exception that stopped the collector thread
         self._url = "http://%s/client?command=record" % addr
         self._max_tries = 3 # how many times to retry connection
         self._retry_wait = 10 # seconds to wait before retry after failure
+        self._timeout = 5 # seconds to wait for a response from the console
+        self._errors = (socket.error, socket.timeout, URLError, HTTPError)
+        self._session = None
+        if requests is not None:
+            self._session = requests.Session()
+            self._session.headers.update({'Connection': 'keep-alive'})
+            self._errors += (requests.exceptions.RequestException,)
         logdbg("station url: %s" % self._url)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def startup(self):
+        self._stop.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread is not None:
+            # the thread might be waiting to retry or waiting for the
+            # console to respond
+            self._thread.join(self._retry_wait + self._timeout)
+            if self._thread.is_alive():
+                logerr("collector thread did not stop")
+            self._thread = None
+
+    def _run(self):
+        loginf("collector thread started")
+        try:
+            while not self._stop.is_set():
+                data = self.get_data()
+                if data:
+                    self._put((int(_TIME() + 0.5), data))
+                self._stop.wait(self._poll_interval)
+        except Exception as e:
+            # keep the exception so that the driver can report it
+            logerr("collector thread failed: %s" % e)
+            self.error = e
+        loginf("collector thread stopped")
+
+    def _put(self, item):
+        # this thread is the only producer, so once the oldest item has been
+        # removed there is room for the new one.
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+                logdbg("queue full, discarded oldest data")
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(item)
+
+    def _fetch(self):
+        # use the persistent session if we have one, otherwise make a new
+        # connection for each request.
+        if self._session is not None:
+            r = self._session.get(self._url, timeout=self._timeout,
+                                  stream=True)
+            try:
+                r.raise_for_status()
+                resp = b''
+                for chunk in r.iter_content(4096):
+                    resp += chunk
+                    if len(resp) > self.MAX_RESPONSE_SIZE:
+                        break
+            finally:
+                r.close()
+        else:
+            f = urlopen(self._url, timeout=self._timeout)
+            try:
+                resp = f.read(self.MAX_RESPONSE_SIZE + 1)
+            finally:
+                f.close()
+        if len(resp) > self.MAX_RESPONSE_SIZE:
+            raise ValueError("response exceeds %s bytes" %
+                             self.MAX_RESPONSE_SIZE)
+        return resp
+
     def get_data(self):
         for tries in range(self._max_tries):
+            if self._stop.is_set():
+                return None
             try:
-                resp = urlopen(self._url).read()
-                data = json.loads(resp)
+                # pass the raw bytes to the decoder - no need to decode first
+                resp = self._fetch()
+                data = json_loads(resp)
                 return data
-            except (socket.error, socket.timeout, URLError, HTTPError) as e:
+            except self._errors as e:
+                # some of these are also ValueError, so catch them first
                 logerr("failed attempt %s of %s to get data: %s" %
                        (tries + 1, self._max_tries, e))
-                time.sleep(self._retry_wait)
-            else:
-                logerr("failed to get data after %s attempts" %
-                       self._max_tries)
+                # wait before retrying, unless we are asked to stop
+                if self._stop.wait(self._retry_wait):
+                    return None
+            except ValueError as e:
+                # the console sent a bad or truncated response, but the
+                # connection is fine, so try again right away
+                logerr("bad response on attempt %s of %s: %s" %
+                       (tries + 1, self._max_tries, e))
+        logerr("failed to get data after %s attempts" % self._max_tries)
         return None
 
 